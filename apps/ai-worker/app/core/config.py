@@ -1,32 +1,79 @@
 import os, json
+from dataclasses import dataclass
 
 
+def _env_bool(name: str, default: str = "false") -> bool:
+    return os.getenv(name, default).lower() in ("1", "true", "yes")
+
+
+@dataclass(frozen=True, slots=True)
 class Cfg:
-    APP_HOST = os.getenv("APP_HOST", "0.0.0.0")
-    APP_PORT = int(os.getenv("APP_PORT", "8001"))
-    ORIGINS = os.getenv("CORS_ALLOWED_ORIGINS", "*").split(",")
-    API_KEY = os.getenv("GATEWAY_API_KEY", "dev-secret")
-    ASR_NAME = os.getenv("ASR_MODEL_NAME", "small")
-    ASR_DEVICE = os.getenv("ASR_DEVICE", "cpu")
-    ASR_COMPUTE_TYPE = os.getenv("ASR_COMPUTE_TYPE", "int8")  # float32|int8
-    ASR_LANG = os.getenv("ASR_LANGUAGE", "vi")
-    ASR_BEAM = int(os.getenv("ASR_BEAM_SIZE", "5"))
-    ASR_SAMPLE_RATE = int(os.getenv("ASR_SAMPLE_RATE", "16000"))
-    # Rate limit giữa các chunk theo session (ms). 0 = tắt
-    ASR_MIN_INTERVAL_MS = int(os.getenv("ASR_MIN_INTERVAL_MS", "0"))
-    PHOBERT_DIR = os.getenv("PHOBERT_CHECKPOINT_DIR", "./models-and-dataset/phobert-base")
-    LABEL_MAP = json.loads(os.getenv("MOD_LABELS_JSON", '{"safe":0,"warn":1,"block":2}'))
-    TEXT_MAX_LEN = int(os.getenv("TEXT_MAX_LEN", "256"))
-    # Gate heavy model loading to keep tests fast
-    AI_LOAD_MODELS = os.getenv("AI_LOAD_MODELS", "false").lower() in ("1", "true", "yes")
-    # Optional ONNXRuntime for PhoBERT
-    PHOBERT_ONNX_DIR = os.getenv("PHOBERT_ONNX_DIR", "")
-    USE_ONNXRUNTIME = os.getenv("USE_ONNXRUNTIME", "false").lower() in ("1", "true", "yes")
-    # Chạy moderation ngay trong ASR (tích hợp detections)
-    ASR_RUN_MOD = os.getenv("ASR_RUN_MOD", "false").lower() in ("1", "true", "yes")
-    # Thresholds for moderation mapping (tunable via env)
-    PHOBERT_BLOCK_THRESHOLD = float(os.getenv("PHOBERT_BLOCK_THRESHOLD", "0.6"))
-    PHOBERT_WARN_THRESHOLD = float(os.getenv("PHOBERT_WARN_THRESHOLD", "0.5"))
-
-
-cfg = Cfg()
+    """Cấu hình đọc từ env đúng một lần khi import module.
+
+    Frozen + slots: truy cập thuộc tính đi thẳng vào slot thay vì tra __dict__,
+    và không ai có thể vô tình ghi đè config lúc runtime.
+    """
+
+    APP_HOST: str
+    APP_PORT: int
+    ORIGINS: list[str]
+    API_KEY: str
+    ASR_NAME: str
+    ASR_DEVICE: str
+    ASR_COMPUTE_TYPE: str
+    ASR_LANG: str
+    ASR_BEAM: int
+    ASR_SAMPLE_RATE: int
+    ASR_MIN_INTERVAL_MS: int
+    PHOBERT_DIR: str
+    LABEL_MAP: dict[str, int]
+    # Nghịch đảo của LABEL_MAP, index theo id (0/1/2) — tra tuple thay vì dựng dict mỗi request
+    ID2LABEL: tuple[str, ...]
+    TEXT_MAX_LEN: int
+    AI_LOAD_MODELS: bool
+    PHOBERT_ONNX_DIR: str
+    USE_ONNXRUNTIME: bool
+    PHOBERT_TORCH_COMPILE: bool
+    ASR_RUN_MOD: bool
+    ASR_MOD_BATCH: bool
+    PHOBERT_BLOCK_THRESHOLD: float
+    PHOBERT_WARN_THRESHOLD: float
+
+
+def _load_from_env() -> Cfg:
+    label_map: dict[str, int] = json.loads(os.getenv("MOD_LABELS_JSON", '{"safe":0,"warn":1,"block":2}'))
+    return Cfg(
+        APP_HOST=os.getenv("APP_HOST", "0.0.0.0"),
+        APP_PORT=int(os.getenv("APP_PORT", "8001")),
+        ORIGINS=os.getenv("CORS_ALLOWED_ORIGINS", "*").split(","),
+        API_KEY=os.getenv("GATEWAY_API_KEY", "dev-secret"),
+        ASR_NAME=os.getenv("ASR_MODEL_NAME", "small"),
+        ASR_DEVICE=os.getenv("ASR_DEVICE", "cpu"),
+        ASR_COMPUTE_TYPE=os.getenv("ASR_COMPUTE_TYPE", "int8"),  # float32|int8
+        ASR_LANG=os.getenv("ASR_LANGUAGE", "vi"),
+        ASR_BEAM=int(os.getenv("ASR_BEAM_SIZE", "5")),
+        ASR_SAMPLE_RATE=int(os.getenv("ASR_SAMPLE_RATE", "16000")),
+        # Rate limit giữa các chunk theo session (ms). 0 = tắt
+        ASR_MIN_INTERVAL_MS=int(os.getenv("ASR_MIN_INTERVAL_MS", "0")),
+        PHOBERT_DIR=os.getenv("PHOBERT_CHECKPOINT_DIR", "./models-and-dataset/phobert-base"),
+        LABEL_MAP=label_map,
+        ID2LABEL=tuple(sorted(label_map, key=label_map.get)),
+        TEXT_MAX_LEN=int(os.getenv("TEXT_MAX_LEN", "256")),
+        # Gate heavy model loading to keep tests fast
+        AI_LOAD_MODELS=_env_bool("AI_LOAD_MODELS"),
+        # Optional ONNXRuntime for PhoBERT
+        PHOBERT_ONNX_DIR=os.getenv("PHOBERT_ONNX_DIR", ""),
+        USE_ONNXRUNTIME=_env_bool("USE_ONNXRUNTIME"),
+        # torch.compile cho nhánh PyTorch (opt-in: có thể phản tác dụng với graph nhỏ)
+        PHOBERT_TORCH_COMPILE=_env_bool("PHOBERT_TORCH_COMPILE"),
+        # Chạy moderation ngay trong ASR (tích hợp detections)
+        ASR_RUN_MOD=_env_bool("ASR_RUN_MOD"),
+        # Gom moderation trong ASR thành micro-batch (dynamic batching)
+        ASR_MOD_BATCH=_env_bool("ASR_MOD_BATCH"),
+        # Thresholds for moderation mapping (tunable via env)
+        PHOBERT_BLOCK_THRESHOLD=float(os.getenv("PHOBERT_BLOCK_THRESHOLD", "0.6")),
+        PHOBERT_WARN_THRESHOLD=float(os.getenv("PHOBERT_WARN_THRESHOLD", "0.5")),
+    )
+
+
+cfg = _load_from_env()
@@ -1,8 +1,13 @@
+from hmac import compare_digest
 from fastapi import Header, HTTPException
 from .config import cfg
 
+# Encode một lần lúc import để mỗi request chỉ còn encode giá trị client gửi lên
+_API_KEY_BYTES = cfg.API_KEY.encode("utf-8")
+
 
 def verify_api_key(x_api_key: str | None = Header(default=None)):
-    if x_api_key != cfg.API_KEY:
+    # compare_digest: so sánh constant-time, tránh timing attack trên API key
+    if not x_api_key or not compare_digest(x_api_key.encode("utf-8"), _API_KEY_BYTES):
         raise HTTPException(status_code=401, detail="invalid api key")
     return True
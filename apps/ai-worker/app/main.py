@@ -1,10 +1,11 @@
 from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse, PlainTextResponse
+from fastapi.responses import JSONResponse, ORJSONResponse, PlainTextResponse
 from .lifespan import lifespan
 from .routers.asr import router as asr_router
 from .routers.moderation import router as mod_router
-from .core.config import cfg
+from .core.config import cfg, _env_bool
+from .utils import BoundedLRUDict
 from pathlib import Path
 import os
 import logging
@@ -20,12 +21,32 @@ logger = logging.getLogger("ai-worker")
 
 def create_app() -> FastAPI:
     logger.info("Khởi tạo ứng dụng VN Speech Guardian AI (MVP)")
-    app = FastAPI(title="VN Speech Guardian AI (MVP)", lifespan=lifespan)
-    # CORS cho dev
+    # orjson serialize nhanh hơn json thuần nhiều lần cho payload dict nhỏ
+    app = FastAPI(title="VN Speech Guardian AI (MVP)", lifespan=lifespan, default_response_class=ORJSONResponse)
+    # Rate limit giữa các chunk ASR: đọc env một lần khi tạo app thay vì mỗi request
+    try:
+        app.state.asr_min_interval_ms = int(os.getenv("ASR_MIN_INTERVAL_MS", str(cfg.ASR_MIN_INTERVAL_MS)))
+    except ValueError:
+        app.state.asr_min_interval_ms = cfg.ASR_MIN_INTERVAL_MS
+    app.state.asr_run_mod = _env_bool("ASR_RUN_MOD", "true" if cfg.ASR_RUN_MOD else "false")
+    # Placeholder để handler truy cập trực tiếp app.state.models không cần hasattr;
+    # lifespan sẽ thay bằng model thật khi startup.
+    app.state.models = {"whisper": None, "phobert": None}
+    # Rate-limit map bị chặn kích thước (LRU) để không leak memory theo session id
+    app.state._asr_rl = BoundedLRUDict(max_size=10_000)
+    # Micro-batcher moderation: lifespan sẽ gán instance thật nếu ASR_MOD_BATCH bật
+    app.state.mod_batcher = None
+    # CORS đọc từ cfg.ORIGINS. Wildcard + credentials là tổ hợp không hợp lệ theo
+    # spec (và khiến Starlette đi nhánh explicit-origin đắt hơn mỗi response),
+    # nên "*" thu gọn thành một entry duy nhất không kèm credentials.
+    if "*" in cfg.ORIGINS:
+        allow_origins, allow_credentials = ["*"], False
+    else:
+        allow_origins, allow_credentials = cfg.ORIGINS, True
     app.add_middleware(
         CORSMiddleware,
-        allow_origins=["http://localhost:3000", "http://localhost:5173", "*"],
-        allow_credentials=True,
+        allow_origins=allow_origins,
+        allow_credentials=allow_credentials,
         allow_methods=["*"],
         allow_headers=["*"],
     )
@@ -54,46 +75,81 @@ def create_app() -> FastAPI:
             "phobert_loaded": phobert_loaded,
         }
 
-    # Middleware: logging các request và thu thập metrics nếu có
+    # Khởi tạo các metric cơ bản (nếu prometheus_client có sẵn). Việc này làm lazy import.
+    try:
+        from prometheus_client import Counter, Histogram
+
+        app.state.metrics = {
+            "request_count": Counter("vsg_request_count", "Số lượng request", ["method", "path", "status"]),
+            "request_latency": Histogram("vsg_request_latency_seconds", "Thời gian xử lý request", ["method", "path"]),
+            "exceptions_count": Counter("vsg_exceptions_total", "Số lỗi không mong muốn"),
+        }
+        logger.info("Metrics Prometheus đã khởi tạo")
+    except Exception:
+        app.state.metrics = None
+        logger.info("Prometheus metrics không khả dụng (package có thể chưa được cài). Tiếp tục khởi chạy mà không có metrics")
+
+    # Middleware: logging các request và thu thập metrics nếu có.
+    # Toàn bộ gating quyết định MỘT lần ở đây: closure giữ thẳng counter/histogram
+    # (hoặc None), request path chỉ còn một nhánh bool — không getattr, không
+    # try/except dựng frame mỗi request.
+    metrics = app.state.metrics
+    metrics_enabled = metrics is not None
+    _req_counter = metrics["request_count"] if metrics_enabled else None
+    _req_hist = metrics["request_latency"] if metrics_enabled else None
+    _exc_counter = metrics["exceptions_count"] if metrics_enabled else None
+    label_cache: dict = {}
+    # Probe paths được orchestrator gọi với tần suất cao (1-10Hz): bỏ qua toàn bộ
+    # timing/log/metrics để không trả "thuế instrumentation" cho traffic probe.
+    fast_paths = frozenset({"/healthz", "/readyz", "/metrics"})
+    slow_request_s = 1.0
+
     @app.middleware("http")
     async def log_requests(request: Request, call_next):
-        start = time.time()
+        if request.url.path in fast_paths:
+            return await call_next(request)
+        start = time.perf_counter_ns()
         try:
             response = await call_next(request)
             status = response.status_code
-        except Exception as exc:  # let exception handler manage the response
+        except Exception:  # let exception handler manage the response
             status = 500
             raise
         finally:
-            elapsed = time.time() - start
-            logger.info(f"Yêu cầu {request.method} {request.url.path} -> {status} (thời gian: {elapsed:.3f}s)")
-            # Nếu metrics được bật trong app.state, cập nhật
-            metrics = getattr(app.state, "metrics", None)
-            if metrics:
-                try:
-                    metrics["request_count"].labels(method=request.method, path=request.url.path, status=str(status)).inc()
-                    metrics["request_latency"].labels(method=request.method, path=request.url.path).observe(elapsed)
-                except Exception:
-                    logger.debug("Không thể cập nhật metrics")
+            elapsed = (time.perf_counter_ns() - start) * 1e-9
+            # Log-on-slow: request bình thường ở DEBUG, chỉ nổi WARNING khi chậm.
+            # %-format lười: chỉ render chuỗi nếu log level cho phép.
+            if elapsed >= slow_request_s:
+                logger.warning("Yêu cầu chậm %s %s -> %s (thời gian: %.3fs)", request.method, request.url.path, status, elapsed)
+            else:
+                logger.debug("Yêu cầu %s %s -> %s (thời gian: %.3fs)", request.method, request.url.path, status, elapsed)
+            if metrics_enabled:
+                # labels() đã resolve được cache theo (method, path, status) —
+                # một dict hit thay cho hashing chuỗi label trong prometheus_client.
+                key = (request.method, request.url.path, status)
+                pair = label_cache.get(key)
+                if pair is None:
+                    pair = (
+                        _req_counter.labels(method=key[0], path=key[1], status=str(status)),
+                        _req_hist.labels(method=key[0], path=key[1]),
+                    )
+                    label_cache[key] = pair
+                pair[0].inc()
+                pair[1].observe(elapsed)
         return response
 
     # Global exception handler: log chi tiết bằng tiếng Việt
     @app.exception_handler(Exception)
     async def global_exception_handler(request: Request, exc: Exception):
         logger.exception(f"Lỗi không mong muốn khi xử lý {request.method} {request.url.path}: {exc}")
-        metrics = getattr(app.state, "metrics", None)
-        if metrics:
-            try:
-                metrics["exceptions_count"].inc()
-            except Exception:
-                pass
+        if metrics_enabled:
+            _exc_counter.inc()
         return JSONResponse(status_code=500, content={"detail": "Lỗi nội bộ máy chủ. Vui lòng liên hệ admin."})
 
     # /metrics: xuất Prometheus metrics nếu thư viện có sẵn và metrics được khởi tạo
     @app.get("/metrics")
     async def metrics_endpoint():
-        metrics = getattr(app.state, "metrics", None)
-        if not metrics:
+        if not metrics_enabled:
             return PlainTextResponse("Metrics chưa được bật trên service này.", status_code=501)
         try:
             # import lazy để tránh bắt buộc dependency khi chạy tests nhẹ
@@ -106,19 +162,6 @@ def create_app() -> FastAPI:
 
     app.include_router(asr_router)
     app.include_router(mod_router)
-    # Khởi tạo các metric cơ bản (nếu prometheus_client có sẵn). Việc này làm lazy import.
-    try:
-        from prometheus_client import Counter, Histogram
-
-        app.state.metrics = {
-            "request_count": Counter("vsg_request_count", "Số lượng request", ["method", "path", "status"]),
-            "request_latency": Histogram("vsg_request_latency_seconds", "Thời gian xử lý request", ["method", "path"]),
-            "exceptions_count": Counter("vsg_exceptions_total", "Số lỗi không mong muốn"),
-        }
-        logger.info("Metrics Prometheus đã khởi tạo")
-    except Exception:
-        app.state.metrics = None
-        logger.info("Prometheus metrics không khả dụng (package có thể chưa được cài). Tiếp tục khởi chạy mà không có metrics")
     return app
 
 
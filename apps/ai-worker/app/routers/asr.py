@@ -1,11 +1,10 @@
 from fastapi import APIRouter, Header, HTTPException, Request, Depends
+from fastapi.responses import ORJSONResponse
 from ..core.security import verify_api_key
 from ..services.asr_service import transcribe_bytes
 from ..schemas.asr_schema import ASRResponse
-from ..core.config import cfg
 from ..services.bert_service import predict as predict_mod
 import time
-import numpy as np  # type: ignore
 
 router = APIRouter(tags=["asr"])
 
@@ -21,16 +20,10 @@ async def asr_stream(
     if not x_session_id:
         raise HTTPException(status_code=400, detail="missing x-session-id")
 
-    # Simple per-session rate limit (in-memory)
-    import os
-    try:
-        min_interval = int(os.getenv("ASR_MIN_INTERVAL_MS", str(cfg.ASR_MIN_INTERVAL_MS)))
-    except Exception:
-        min_interval = cfg.ASR_MIN_INTERVAL_MS
+    # Simple per-session rate limit (in-memory); interval được đọc một lần lúc tạo app
+    min_interval = request.app.state.asr_min_interval_ms
     if min_interval > 0:
         now_ms = int(time.time() * 1000)
-        if not hasattr(request.app.state, "_asr_rl"):  # pragma: no cover - trivial state init
-            request.app.state._asr_rl = {}
         last = request.app.state._asr_rl.get(x_session_id)
         if last and now_ms - last < min_interval:
             raise HTTPException(status_code=429, detail="too many chunks")
@@ -40,21 +33,26 @@ async def asr_stream(
     if not data:
         raise HTTPException(status_code=400, detail="empty body")
 
-    # Validate PCM16LE length (multiple of 2 bytes)
-    if len(data) % 2 != 0:
+    # Validate PCM16LE length (multiple of 2 bytes) — bit-test rẻ hơn modulo
+    if len(data) & 1:
         raise HTTPException(status_code=400, detail="malformed PCM16LE")
 
-    # Lấy model whisper nếu đã nạp (AI_LOAD_MODELS=true)
-    model = getattr(request.app.state, "models", {}).get("whisper", None) if hasattr(request.app.state, "models") else None
-    res = transcribe_bytes(data, model=model)
+    # Lấy model whisper nếu đã nạp (AI_LOAD_MODELS=true). app.state.models luôn
+    # tồn tại: create_app khởi tạo placeholder, lifespan thay bằng model thật.
+    models = request.app.state.models
+    res = transcribe_bytes(data, model=models.get("whisper"))
 
     # Optional moderation integrated in ASR response
     detections = []
-    if cfg.ASR_RUN_MOD:
+    if request.app.state.asr_run_mod:
         text_for_mod = res.get("text", "").strip()
         if text_for_mod:
-            phobert = getattr(request.app.state, "models", {}).get("phobert") if hasattr(request.app.state, "models") else None
-            mod_out = predict_mod([text_for_mod], phobert)
+            batcher = request.app.state.mod_batcher
+            if batcher is not None:
+                # Dynamic batching: chờ batcher gom các chunk đến cùng lúc rồi predict một lần
+                mod_out = [await batcher.submit(text_for_mod)]
+            else:
+                mod_out = predict_mod([text_for_mod], models.get("phobert"))
             # Map to forward-protocol detections (use entire chunk time if available)
             # We don't have exact ms here; set None or 0; gateway will apply hysteresis over snippets.
             for d in mod_out:
@@ -72,4 +70,6 @@ async def asr_stream(
         payload["final"] = {"text": res.get("text", ""), "words": []}
     else:
         payload["partial"] = {"text": res.get("text", "")}
-    return payload
+    # Handler đã dựng đúng shape ASRResponse; trả ORJSONResponse trực tiếp để khỏi
+    # đi qua vòng validate/serialize Pydantic lần nữa trên hot path.
+    return ORJSONResponse(payload)
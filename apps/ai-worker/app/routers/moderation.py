@@ -1,3 +1,5 @@
+import asyncio
+
 from fastapi import APIRouter, Depends, Request
 from pydantic import BaseModel, Field
 from ..core.security import verify_api_key
@@ -16,5 +18,11 @@ async def moderation(body: ModerationInput, request: Request, _=Depends(verify_a
     # Lấy model phobert từ app.state nếu đã nạp qua lifespan
     models = getattr(request.app.state, "models", {}) if hasattr(request.app.state, "models") else {}
     phobert_model = models.get("phobert", None) if isinstance(models, dict) else None
-    results = predict(body.inputs, phobert=phobert_model)
+    # Dynamic batching (nếu ASR_MOD_BATCH bật): các request đồng thời được gom
+    # thành một forward pass thay vì mỗi request một lần tokenize + model call.
+    batcher = request.app.state.mod_batcher
+    if batcher is not None:
+        results = list(await asyncio.gather(*(batcher.submit(s) for s in body.inputs)))
+    else:
+        results = predict(body.inputs, phobert=phobert_model)
     return {"results": results}
@@ -1,6 +1,23 @@
 from typing import Any
+import threading
+import numpy as np
 from ..core.config import cfg
-from ..utils import validate_pcm16le, pcm16le_bytes_to_float32
+from ..utils import pcm16le_bytes_to_float32
+
+# Buffer float32 dùng lại giữa các chunk (tránh cấp phát lại mỗi request).
+# Thread-local để an toàn nếu transcribe chạy trên nhiều thread (vd. to_thread).
+# Kích thước theo chunk dài nhất chấp nhận được (30s @ sample rate cấu hình).
+MAX_CHUNK_SECONDS = 30
+_BUF_SAMPLES = cfg.ASR_SAMPLE_RATE * MAX_CHUNK_SECONDS
+_tls = threading.local()
+
+
+def _f32_buffer() -> np.ndarray:
+    buf = getattr(_tls, "f32_buf", None)
+    if buf is None:
+        buf = np.empty(_BUF_SAMPLES, dtype=np.float32)
+        _tls.f32_buf = buf
+    return buf
 
 
 def _stub_transcribe(data: bytes) -> dict:
@@ -21,11 +38,13 @@ def transcribe_bytes(data: bytes, model: Any | None = None) -> dict:
 
     try:  # pragma: no cover - phụ thuộc vào model thực tế, khó tái lập trong CI
         # faster-whisper API nhận input là path/array/samples; ở đây chỉ demo fallback.
-        # Dùng helper chung để chuyển PCM16LE bytes -> numpy float32
-        if not validate_pcm16le(data):
+        # Bit-test độ dài inline (thay vì gọi validate_pcm16le) — tránh một frame
+        # gọi hàm Python mỗi chunk trên streaming path.
+        if len(data) & 1:
             # Let higher-level validate; but double-check here too
             return _stub_transcribe(data)
-        audio, _ = pcm16le_bytes_to_float32(data)
+        n = len(data) // 2
+        audio, _ = pcm16le_bytes_to_float32(data, out=_f32_buffer() if n <= _BUF_SAMPLES else None)
 
         segments, info = model.transcribe(
             audio,
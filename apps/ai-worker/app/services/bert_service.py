@@ -1,28 +1,239 @@
 from typing import Any
+import threading
+import numpy as np
 import torch
-import torch.nn.functional as F
 from ..core.config import cfg
+from ..utils import BoundedLRUDict
 from pathlib import Path
 import json
 
 
+# Nghịch đảo LABEL_MAP tính sẵn lúc import (dùng làm fallback id2label)
+_ID2LABEL_FALLBACK = dict(enumerate(cfg.ID2LABEL))
+
+
+def _encode_batch(tok: Any, batch: list[str], tensors: str):  # pragma: no cover - cần tokenizer thật
+    """Tokenize một batch, ưu tiên backend Rust (encode_batch) nếu là fast tokenizer.
+
+    Backend được bật sẵn truncation/padding trong lifespan nên một lời gọi Rust
+    đa luồng thay cho vòng glue Python của PreTrainedTokenizerBase.__call__.
+    """
+    backend = getattr(tok, "backend_tokenizer", None)
+    if backend is not None and backend.padding is not None and backend.truncation is not None:
+        encs = backend.encode_batch(batch)
+        ids = [e.ids for e in encs]
+        mask = [e.attention_mask for e in encs]
+        if tensors == "np":
+            return {"input_ids": np.asarray(ids, dtype=np.int64), "attention_mask": np.asarray(mask, dtype=np.int64)}
+        return {"input_ids": torch.as_tensor(ids), "attention_mask": torch.as_tensor(mask)}
+    # padding="longest" đi thẳng nhánh mới của HF (padding=True rơi vào nhánh
+    # legacy); PhoBERT không dùng token_type_ids nên tắt hẳn để khỏi cấp phát.
+    enc = tok(
+        batch,
+        padding="longest",
+        truncation=True,
+        max_length=cfg.TEXT_MAX_LEN,
+        return_tensors=tensors,
+        return_token_type_ids=False,
+    )
+    return {"input_ids": enc["input_ids"], "attention_mask": enc["attention_mask"]}
+
+
+# Danh sách từ khóa heuristic (lowercase sẵn)
+_HEUR_BLOCK_KEYWORDS = (
+    "đồ ngu", "đồ khốn", "đồ mất dạy", "mất dạy", "khốn nạn",
+    "chửi", "chửi bậy", "cút", "đm", "dm", "dmm", "cc",
+    "fuck", "wtf",
+)
+_HEUR_WARN_KEYWORDS = ("cảnh báo", "warning")
+# Override cứng trong predict: rộng hơn heuristic một chút (biến thể che sao)
+_HARD_BLOCK_KEYWORDS = (
+    "đồ ngu", "đồ khốn", "đồ mất dạy", "mất dạy", "khốn nạn",
+    "đm", "dm", "dmm", "cc", "fuck", "f**k", "f***", "wtf",
+)
+
+# Aho–Corasick: một automaton biên dịch sẵn lúc import quét toàn bộ keyword trong
+# một lượt O(len(text)), thay vì mỗi keyword một lần substring-search Python.
+try:
+    import ahocorasick  # type: ignore
+
+    def _make_matcher(words: tuple[str, ...]):
+        a = ahocorasick.Automaton()
+        for w in words:
+            a.add_word(w, w)
+        a.make_automaton()
+
+        def match(sl: str, _a=a) -> bool:
+            return next(_a.iter(sl), None) is not None
+
+        return match
+
+    # Một automaton duy nhất mang payload nhãn: classify block/warn/safe trong
+    # MỘT lượt quét C thay vì hai matcher nối tiếp (block rồi warn).
+    _KEYWORD_AC = ahocorasick.Automaton()
+    for _w in _HEUR_BLOCK_KEYWORDS:
+        _KEYWORD_AC.add_word(_w, "block")
+    for _w in _HEUR_WARN_KEYWORDS:
+        _KEYWORD_AC.add_word(_w, "warn")
+    _KEYWORD_AC.make_automaton()
+
+    def _classify_keywords(sl: str) -> str | None:
+        label = None
+        for _, lab in _KEYWORD_AC.iter(sl):
+            if lab == "block":
+                return "block"
+            label = lab
+        return label
+except ImportError:  # pragma: no cover - fallback khi chưa cài pyahocorasick
+    # Quét trên bytes UTF-8 thay vì str: bytes.find đi vào default_find của
+    # CPython (Boyer-Moore + bloom filter theo byte), rẻ hơn tra code point
+    # cho các needle ngắn. Keyword encode sẵn một lần lúc import.
+
+    def _make_matcher(words: tuple[str, ...]):
+        words_b = tuple(w.encode("utf-8") for w in words)
+
+        def match(sl: str) -> bool:
+            slb = sl.encode("utf-8")
+            return any(k in slb for k in words_b)
+
+        return match
+
+    _HEUR_BLOCK_B = tuple(k.encode("utf-8") for k in _HEUR_BLOCK_KEYWORDS)
+    _HEUR_WARN_B = tuple(k.encode("utf-8") for k in _HEUR_WARN_KEYWORDS)
+
+    def _classify_keywords(sl: str) -> str | None:
+        slb = sl.encode("utf-8")
+        if any(k in slb for k in _HEUR_BLOCK_B):
+            return "block"
+        if any(k in slb for k in _HEUR_WARN_B):
+            return "warn"
+        return None
+
+
+_match_warn = _make_matcher(_HEUR_WARN_KEYWORDS)
+_match_hard_block = _make_matcher(_HARD_BLOCK_KEYWORDS)
+
+
+def _resolve_id2label(phobert: dict, tok: Any) -> dict[int, str]:  # pragma: no cover - cần model thật
+    """Suy ra map id -> tên nhãn, ưu tiên model.config rồi config.json rồi env.
+
+    Giá trị bất biến sau khi nạp model nên chỉ được tính MỘT lần; predict cache
+    kết quả vào phobert["_id2label"] để hot path không còn đọc disk/parse JSON.
+    """
+    # 1) model.config.id2label nếu có model PyTorch
+    if phobert.get("model") is not None:
+        try:
+            raw = getattr(phobert["model"].config, "id2label", None)
+            if isinstance(raw, dict) and raw:
+                # Normalize: keys may be strings; values might be strings or ints
+                tmp: dict[int, str] = {}
+                for k, v in raw.items():
+                    ik = int(k)
+                    if isinstance(v, str):
+                        tmp[ik] = v
+                    else:
+                        # e.g., {"0":0,...} → map via inverse env to names
+                        tmp[ik] = _ID2LABEL_FALLBACK.get(int(v), str(v))
+                return tmp
+        except Exception:
+            pass
+    # 2) config.json cạnh tokenizer nếu có
+    try:
+        # AutoTokenizer usually keeps the directory in name_or_path
+        name_or_path = getattr(tok, "name_or_path", None)
+        if name_or_path:
+            cfg_path = Path(str(name_or_path)) / "config.json"
+            if cfg_path.exists():
+                with cfg_path.open("r", encoding="utf-8") as f:
+                    cfg_json = json.load(f)
+                raw = cfg_json.get("id2label")
+                if isinstance(raw, dict) and raw:
+                    tmp2: dict[int, str] = {}
+                    for k, v in raw.items():
+                        ik = int(k)
+                        if isinstance(v, str):
+                            tmp2[ik] = v
+                        else:
+                            tmp2[ik] = _ID2LABEL_FALLBACK.get(int(v), str(v))
+                    return tmp2
+    except Exception:
+        pass
+    # 3) Fallback nghịch đảo LABEL_MAP từ env
+    return _ID2LABEL_FALLBACK
+
+
 def _heuristic(batch: list[str]):
     res = []
     for s in batch:
-        sl = s.lower()
-        if any(k in sl for k in [
-            "đồ ngu", "đồ khốn", "đồ mất dạy", "mất dạy", "khốn nạn",
-            "chửi", "chửi bậy", "cút", "đm", "dm", "dmm", "cc",
-            "fuck", "wtf"
-        ]):
+        label = _classify_keywords(s.lower())
+        if label == "block":
             res.append({"label": "block", "score": 0.95})
-        elif any(k in sl for k in ["cảnh báo", "warning"]):
+        elif label == "warn":
             res.append({"label": "warn", "score": 0.8})
         else:
             res.append({"label": "safe", "score": 0.98})
     return res
 
 
+def _softmax_np(x: np.ndarray) -> np.ndarray:
+    """Softmax NumPy theo hàng, ổn định số học (trừ max trước khi exp).
+
+    Logits từ ONNX/PyTorch đều đã nằm trên CPU dưới dạng ndarray; softmax thẳng
+    trên NumPy tránh round-trip numpy -> torch.tensor -> F.softmax -> tolist().
+    """
+    e = np.exp(x - x.max(axis=1, keepdims=True))
+    return e / e.sum(axis=1, keepdims=True)
+
+
+# Ngưỡng bucket theo số từ ước lượng (xem _LEN_BUCKETS dùng trong predict):
+# câu vượt bucket cuối rơi về cap TEXT_MAX_LEN.
+_LEN_BUCKETS = (8, 16, 32, 64)
+
+
+def _forward_logits(phobert: dict, tok: Any, texts: list[str]) -> np.ndarray:  # pragma: no cover - cần model thật
+    """Tokenize + forward một nhóm text, trả logits NumPy (ONNX hoặc PyTorch)."""
+    if phobert.get("onnx_session") is not None:
+        session = phobert["onnx_session"]
+        # Tokenize to numpy inputs expected by ONNX
+        ort_inputs = _encode_batch(tok, texts, "np")
+        ids = ort_inputs["input_ids"]
+        mask = ort_inputs["attention_mask"]
+        # Ghi vào arena cấp phát sẵn (lifespan) nếu batch vừa: ORT thấy cùng
+        # một địa chỉ buffer qua các lần run nên không marshal/cấp phát lại.
+        # Slice phẳng + reshape giữ mảng C-contiguous với seq-len động.
+        arenas = phobert.get("io_arenas")
+        if arenas is not None and ids.size <= arenas["input_ids"].size:
+            b, s = ids.shape
+            dst_ids = arenas["input_ids"][: b * s].reshape(b, s)
+            dst_mask = arenas["attention_mask"][: b * s].reshape(b, s)
+            np.copyto(dst_ids, ids)
+            np.copyto(dst_mask, mask)
+            ids, mask = dst_ids, dst_mask
+        try:
+            # IOBinding: input numpy được bind zero-copy, tránh marshal lại mỗi run.
+            # Binding object KHÔNG thread-safe nên giữ một instance per-thread
+            # thay vì tạo mới mỗi call (hoặc chia sẻ một cái toàn cục).
+            tls = phobert.setdefault("_io_tls", threading.local())
+            io = getattr(tls, "binding", None)
+            if io is None:
+                io = session.io_binding()
+                tls.binding = io
+            io.clear_binding_inputs()
+            io.clear_binding_outputs()
+            io.bind_cpu_input("input_ids", ids)
+            io.bind_cpu_input("attention_mask", mask)
+            io.bind_output("logits")
+            session.run_with_iobinding(io)
+            ort_outs = io.copy_outputs_to_cpu()
+        except Exception:
+            ort_outs = session.run(None, ort_inputs)
+        return np.asarray(ort_outs[0], dtype=np.float32)
+    # PyTorch HF path
+    mdl = phobert["model"].eval()
+    enc = _encode_batch(tok, texts, "pt")
+    return mdl(**enc).logits.cpu().numpy()
+
+
 @torch.inference_mode()
 def predict(batch: list[str], phobert: Any | None = None):
     # Nếu chưa nạp model, trả heuristic để nhanh
@@ -33,113 +244,118 @@ def predict(batch: list[str], phobert: Any | None = None):
         if tok is None:
             return _heuristic(batch)
 
-        # Resolve id2label preference: model.config -> explicit in dict -> config.json in dir -> fallback env map
-        id2label_map: dict[int, str] | None = None
-        # 1) If model present, try model.config.id2label
-        if isinstance(phobert, dict) and phobert.get("model") is not None:
-            try:
-                raw = getattr(phobert["model"].config, "id2label", None)
-                if isinstance(raw, dict) and raw:
-                    # Normalize: keys may be strings; values might be strings or ints
-                    tmp: dict[int, str] = {}
-                    inv_env = {v: k for k, v in cfg.LABEL_MAP.items()}
-                    for k, v in raw.items():
-                        ik = int(k)
-                        if isinstance(v, str):
-                            tmp[ik] = v
-                        else:
-                            # e.g., {"0":0,...} → map via inverse env to names
-                            tmp[ik] = inv_env.get(int(v), str(v))
-                    id2label_map = tmp
-            except Exception:
-                pass
-        # 2) If still None and tokenizer path has config.json, read id2label
-        if id2label_map is None:
-            try:
-                # AutoTokenizer usually keeps the directory in name_or_path
-                name_or_path = getattr(tok, "name_or_path", None)
-                if name_or_path:
-                    cfg_path = Path(str(name_or_path)) / "config.json"
-                    if cfg_path.exists():
-                        with cfg_path.open("r", encoding="utf-8") as f:
-                            cfg_json = json.load(f)
-                        raw = cfg_json.get("id2label")
-                        if isinstance(raw, dict) and raw:
-                            tmp: dict[int, str] = {}
-                            inv_env = {v: k for k, v in cfg.LABEL_MAP.items()}
-                            for k, v in raw.items():
-                                ik = int(k)
-                                if isinstance(v, str):
-                                    tmp[ik] = v
-                                else:
-                                    tmp[ik] = inv_env.get(int(v), str(v))
-                            id2label_map = tmp
-            except Exception:
-                pass
-        # 3) Fallback to env inverse mapping
+        # id2label bất biến sau khi nạp model: resolve một lần rồi cache vào dict
+        id2label_map = phobert.get("_id2label")
         if id2label_map is None:
-            id2label_map = {v: k for k, v in cfg.LABEL_MAP.items()}
-
-        # ONNXRuntime path
-        if isinstance(phobert, dict) and phobert.get("onnx_session") is not None:
-            session = phobert["onnx_session"]
-            # Tokenize to numpy inputs expected by ONNX
-            enc = tok(batch, padding=True, truncation=True, max_length=cfg.TEXT_MAX_LEN, return_tensors="np")
-            ort_inputs = {k: v for k, v in enc.items() if k in ("input_ids", "attention_mask")}
-            ort_outs = session.run(None, ort_inputs)
-            logits = torch.tensor(ort_outs[0])
-            probs = F.softmax(logits, dim=-1).cpu().tolist()
+            id2label_map = _resolve_id2label(phobert, tok)
+            phobert["_id2label"] = id2label_map
+
+        # Heuristic-first: text đã khớp keyword override thì quyết định xong,
+        # không cần tokenize + forward — override phía dưới vốn luôn thắng model.
+        # Chỉ những index chưa phân loại mới đi qua model.
+        out: list[dict | None] = []
+        pending_idx: list[int] = []
+        for i, s in enumerate(batch):
+            sl = s.lower()
+            if _match_hard_block(sl):
+                out.append({"label": "block", "score": 0.9})
+            elif _match_warn(sl):
+                out.append({"label": "warn", "score": 0.6})
+            else:
+                out.append(None)
+                pending_idx.append(i)
+        if not pending_idx:
+            return out
+
+        # Cache LRU kết quả theo text, treo trên chính dict model: tự vô hiệu khi
+        # model được nạp lại, và traffic lặp (partial transcript giống nhau) khỏi
+        # trả tiền tokenize + forward lần nữa.
+        cache = phobert.get("_pred_cache")
+        if cache is None:
+            cache = phobert["_pred_cache"] = BoundedLRUDict(max_size=4096)
+        uncached_idx: list[int] = []
+        for i in pending_idx:
+            hit = cache.get(batch[i])
+            if hit is not None:
+                out[i] = hit
+            else:
+                uncached_idx.append(i)
+        if not uncached_idx:
+            return out
+
+        # Khử trùng lặp trong batch: text xuất hiện nhiều lần (session gửi lại
+        # cùng partial transcript) chỉ tokenize + forward một lần, kết quả được
+        # fan-out về mọi vị trí gốc sau khi map xong.
+        first_pos: dict[str, int] = {}
+        dup_of: dict[int, int] = {}
+        unique_idx: list[int] = []
+        for i in uncached_idx:
+            s = batch[i]
+            j = first_pos.get(s)
+            if j is None:
+                first_pos[s] = i
+                unique_idx.append(i)
+            else:
+                dup_of[i] = j
+        pending_idx = unique_idx
+        pending = [batch[i] for i in pending_idx]
+
+        # Bucketed padding: batch trộn câu ngắn/dài bị pad hết lên câu dài nhất,
+        # đốt FLOPs vào token <pad>. Gom index theo độ dài ước lượng (số từ) và
+        # forward từng bucket riêng, rồi ghép logits lại đúng thứ tự ban đầu.
+        if len(pending) >= 4:
+            groups: dict[int, list[int]] = {}
+            for j, s in enumerate(pending):
+                est = len(s.split())
+                cap = next((b for b in _LEN_BUCKETS if est <= b), cfg.TEXT_MAX_LEN)
+                groups.setdefault(cap, []).append(j)
+            parts = []
+            part_idx: list[int] = []
+            for cap in sorted(groups):
+                idxs = groups[cap]
+                parts.append(_forward_logits(phobert, tok, [pending[j] for j in idxs]))
+                part_idx.extend(idxs)
+            logits_cat = np.concatenate(parts, axis=0)
+            logits_np = np.empty_like(logits_cat)
+            logits_np[part_idx] = logits_cat
         else:
-            # PyTorch HF path
-            mdl = phobert["model"].eval()
-            enc = tok(batch, padding=True, truncation=True, max_length=cfg.TEXT_MAX_LEN, return_tensors="pt")
-            logits = mdl(**enc).logits
-            probs = F.softmax(logits, dim=-1).cpu().tolist()
-        out = []
-        # Prepare keyword override lists (kept local to prediction for easy tuning)
-        hard_block = [
-            "đồ ngu", "đồ khốn", "đồ mất dạy", "mất dạy", "khốn nạn",
-            "đm", "dm", "dmm", "cc", "fuck", "f**k", "f***", "wtf"
-        ]
-        warn_keys = ["cảnh báo", "warning"]
-
-        for i, p in enumerate(probs):
-            # Map probs to label name via id2label_map
-            label_probs: dict[str, float] = {}
-            for idx, val in enumerate(p):
-                lbl = id2label_map.get(idx, str(idx))
-                label_probs[lbl] = float(val)
-
-            # Raw model argmax
-            idx = int(max(range(len(p)), key=lambda ii: p[ii]))
+            logits_np = _forward_logits(phobert, tok, pending)
+        # Softmax vector hóa một lần cho cả batch; threshold mapping phía dưới
+        # cần prob từng lớp nên không bỏ được, nhưng argmax đi thẳng trên mảng.
+        probs_np = _softmax_np(logits_np)
+        argmax_np = probs_np.argmax(axis=1)
+        # Nghịch đảo id2label cache cùng chỗ với _id2label: prob của block/warn
+        # đọc thẳng theo cột NumPy, không dựng dict {label: prob} mỗi dòng và
+        # cũng không đảo map lại mỗi call.
+        label_to_idx = phobert.get("_label_to_idx")
+        if label_to_idx is None:
+            label_to_idx = {v: k for k, v in id2label_map.items()}
+            phobert["_label_to_idx"] = label_to_idx
+        blk_idx = label_to_idx.get("block")
+        wrn_idx = label_to_idx.get("warn")
+        # Thresholds for moderation mapping (env tunable)
+        block_th = float(cfg.PHOBERT_BLOCK_THRESHOLD)
+        warn_th = float(cfg.PHOBERT_WARN_THRESHOLD)
+        for row, i in enumerate(pending_idx):
+            # Raw model argmax (đã tính vector hóa cho cả batch)
+            idx = int(argmax_np[row])
             model_label = id2label_map.get(idx, str(idx))
-            model_score = float(p[idx])
-
-            text = batch[i].lower()
-            # 1) Keyword overrides (heuristic strong rules)
-            if any(k in text for k in hard_block):
-                out.append({"label": "block", "score": max(model_score, 0.9)})
-                continue
-            if any(k in text for k in warn_keys):
-                out.append({"label": "warn", "score": max(label_probs.get("warn", 0.0), 0.6)})
-                continue
-
-            # 2) Threshold-based mapping using model probabilities per label
-            # Read thresholds from config (env tunable)
-            block_th = float(cfg.PHOBERT_BLOCK_THRESHOLD)
-            warn_th = float(cfg.PHOBERT_WARN_THRESHOLD)
-
-            blk_prob = label_probs.get("block", 0.0)
-            wrn_prob = label_probs.get("warn", 0.0)
-            safe_prob = label_probs.get("safe", 0.0)
+            model_score = float(probs_np[row, idx])
+            blk_prob = float(probs_np[row, blk_idx]) if blk_idx is not None else 0.0
+            wrn_prob = float(probs_np[row, wrn_idx]) if wrn_idx is not None else 0.0
 
+            # Threshold-based mapping using model probabilities per label
             if blk_prob >= block_th:
-                out.append({"label": "block", "score": float(blk_prob)})
+                out[i] = {"label": "block", "score": blk_prob}
             elif wrn_prob >= warn_th:
-                out.append({"label": "warn", "score": float(wrn_prob)})
+                out[i] = {"label": "warn", "score": wrn_prob}
             else:
                 # fallback to model argmax if thresholds didn't pick
-                out.append({"label": model_label, "score": model_score})
+                out[i] = {"label": model_label, "score": model_score}
+            cache[batch[i]] = out[i]
+
+        for i, j in dup_of.items():
+            out[i] = out[j]
 
         return out
     except Exception:  # pragma: no cover
@@ -2,7 +2,14 @@
 
 Expose commonly used helpers from a single package location.
 """
-from .utils import chunk_bytes
-from .audio import validate_pcm16le, pcm16le_bytes_to_float32, pcm16le_bytes_to_int16
+from .utils import chunk_bytes, BoundedLRUDict
+from .audio import validate_pcm16le, pcm16le_decode, pcm16le_bytes_to_float32, pcm16le_bytes_to_int16
 
-__all__ = ["chunk_bytes", "validate_pcm16le", "pcm16le_bytes_to_float32", "pcm16le_bytes_to_int16"]
+__all__ = [
+    "chunk_bytes",
+    "BoundedLRUDict",
+    "validate_pcm16le",
+    "pcm16le_decode",
+    "pcm16le_bytes_to_float32",
+    "pcm16le_bytes_to_int16",
+]
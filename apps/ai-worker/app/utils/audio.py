@@ -7,21 +7,46 @@ from __future__ import annotations
 import numpy as np
 from typing import Tuple
 
+# Scale hệ số int16 -> [-1,1] tính sẵn một lần dưới dạng float32 scalar: nhân với
+# float Python (float64) sẽ ép NumPy sinh intermediate float64 rồi demote lại.
+_PCM16_SCALE = np.float32(1.0 / 32768.0)
+
 
 def validate_pcm16le(data: bytes) -> bool:
-    """Validate that data length is multiple of 2 (int16 samples)."""
-    return len(data) % 2 == 0
+    """Validate that data length is multiple of 2 (int16 samples).
+
+    Hot callers inline the `len(data) & 1` bit-test directly; helper kept for
+    back-compat and tests.
+    """
+    return not (len(data) & 1)
+
+
+def pcm16le_decode(data: bytes, out_f32: np.ndarray | None = None) -> Tuple[np.ndarray, np.ndarray]:
+    """Decode PCM16LE bytes once, returning both the int16 view and float32 samples.
+
+    The int16 array is a zero-copy view over `data`; the float32 array is the
+    scaled [-1,1] version computed with a single fused `np.multiply`. Callers
+    needing both representations (e.g. VAD on int16 + model input in float32)
+    pay one frombuffer and at most one allocation — pass a preallocated
+    `out_f32` buffer to skip even that.
+    """
+    src = np.frombuffer(data, dtype=np.int16)
+    n = src.shape[0]
+    buf = np.empty(n, dtype=np.float32) if out_f32 is None else out_f32[:n]
+    np.multiply(src, _PCM16_SCALE, out=buf)
+    return src, buf
 
 
-def pcm16le_bytes_to_float32(data: bytes) -> Tuple[np.ndarray, int]:
+def pcm16le_bytes_to_float32(data: bytes, out: np.ndarray | None = None) -> Tuple[np.ndarray, int]:
     """Convert PCM16LE bytes to float32 numpy array in range [-1,1].
 
+    Thin wrapper over `pcm16le_decode` kept for back-compat.
     Returns (samples_float32, sample_count)
     """
-    arr = np.frombuffer(data, dtype=np.int16).astype(np.float32) / 32768.0
-    return arr, arr.shape[0]
+    _, buf = pcm16le_decode(data, out_f32=out)
+    return buf, buf.shape[0]
 
 
 def pcm16le_bytes_to_int16(data: bytes) -> np.ndarray:
-    """Return numpy int16 array from PCM16LE bytes."""
+    """Return numpy int16 array from PCM16LE bytes (zero-copy view)."""
     return np.frombuffer(data, dtype=np.int16)
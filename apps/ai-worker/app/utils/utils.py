@@ -1,3 +1,35 @@
+from collections import OrderedDict
+
+
 def chunk_bytes(data: bytes, size: int):
     for i in range(0, len(data), size):
         yield data[i : i + size]
+
+
+class BoundedLRUDict(OrderedDict):
+    """Dict giới hạn kích thước: vượt quá max_size thì loại entry cũ nhất (LRU).
+
+    Dùng cho cache in-memory theo session (vd. rate-limit) để bộ nhớ không phình
+    vô hạn theo số session id từng thấy.
+    """
+
+    def __init__(self, max_size: int = 10_000):
+        super().__init__()
+        self.max_size = max_size
+
+    def __setitem__(self, key, value):
+        super().__setitem__(key, value)
+        self.move_to_end(key)
+        if len(self) > self.max_size:
+            self.popitem(last=False)
+
+    def __getitem__(self, key):
+        value = super().__getitem__(key)
+        self.move_to_end(key)
+        return value
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
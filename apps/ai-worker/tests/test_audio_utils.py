@@ -0,0 +1,55 @@
+import numpy as np
+from app.utils import validate_pcm16le, pcm16le_bytes_to_float32, pcm16le_bytes_to_int16
+
+
+def test_validate_pcm16le():
+    assert validate_pcm16le(b"\x00\x01") is True
+    assert validate_pcm16le(b"\x00\x01\x02") is False
+
+
+def test_pcm16le_bytes_to_float32_values():
+    data = np.array([0, 16384, -32768, 32767], dtype=np.int16).tobytes()
+    arr, n = pcm16le_bytes_to_float32(data)
+    assert n == 4
+    assert arr.dtype == np.float32
+    assert arr[0] == 0.0
+    assert abs(arr[1] - 0.5) < 1e-4
+    assert arr[2] == -1.0
+
+
+def test_pcm16le_bytes_to_float32_reuses_out_buffer():
+    buf = np.empty(8, dtype=np.float32)
+    data = np.arange(4, dtype=np.int16).tobytes()
+    arr, n = pcm16le_bytes_to_float32(data, out=buf)
+    assert n == 4
+    assert arr.base is buf
+
+
+def test_pcm16le_bytes_to_int16():
+    data = np.array([1, -2, 3], dtype=np.int16).tobytes()
+    arr = pcm16le_bytes_to_int16(data)
+    assert arr.tolist() == [1, -2, 3]
+
+
+def test_f32_buffer_reused_per_thread():
+    from app.services.asr_service import _f32_buffer, _BUF_SAMPLES
+
+    a = _f32_buffer()
+    b = _f32_buffer()
+    assert a is b  # cùng thread → cùng buffer
+    assert a.shape[0] == _BUF_SAMPLES and a.dtype == np.float32
+
+
+def test_pcm16le_decode_returns_both_views():
+    from app.utils import pcm16le_decode
+
+    data = np.array([0, 16384, -32768], dtype=np.int16).tobytes()
+    i16, f32 = pcm16le_decode(data)
+    assert i16.dtype == np.int16 and f32.dtype == np.float32
+    assert list(i16) == [0, 16384, -32768]
+    assert f32[1] == 0.5 and f32[2] == -1.0
+
+    # out_f32 được dùng lại thay vì cấp phát mới
+    scratch = np.empty(8, dtype=np.float32)
+    _, f32b = pcm16le_decode(data, out_f32=scratch)
+    assert f32b.base is scratch
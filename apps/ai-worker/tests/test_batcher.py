@@ -0,0 +1,64 @@
+import asyncio
+
+from app.services.batcher import MicroBatcher
+
+
+def _fake_predict(calls):
+    def predict(texts):
+        calls.append(list(texts))
+        return [{"label": "safe", "score": 0.99, "text": t} for t in texts]
+    return predict
+
+
+def test_batcher_groups_concurrent_submits():
+    calls: list = []
+
+    async def main():
+        b = MicroBatcher(_fake_predict(calls), max_batch=8, window_s=0.05)
+        await b.start()
+        try:
+            return await asyncio.gather(*(b.submit(f"t{i}") for i in range(4)))
+        finally:
+            await b.stop()
+
+    res = asyncio.run(main())
+    # Mỗi caller nhận đúng kết quả của text mình gửi
+    assert [r["text"] for r in res] == ["t0", "t1", "t2", "t3"]
+    # Cả 4 submit nằm gọn trong một lần predict (một batch)
+    assert len(calls) == 1
+    assert calls[0] == ["t0", "t1", "t2", "t3"]
+
+
+def test_batcher_respects_max_batch():
+    calls: list = []
+
+    async def main():
+        b = MicroBatcher(_fake_predict(calls), max_batch=2, window_s=0.05)
+        await b.start()
+        try:
+            return await asyncio.gather(*(b.submit(f"t{i}") for i in range(4)))
+        finally:
+            await b.stop()
+
+    res = asyncio.run(main())
+    assert len(res) == 4
+    assert all(len(c) <= 2 for c in calls)
+
+
+def test_batcher_propagates_predict_error():
+    def boom(texts):
+        raise RuntimeError("model hỏng")
+
+    async def main():
+        b = MicroBatcher(boom, window_s=0.01)
+        await b.start()
+        try:
+            await b.submit("x")
+        finally:
+            await b.stop()
+
+    try:
+        asyncio.run(main())
+        assert False, "phải raise RuntimeError"
+    except RuntimeError:
+        pass
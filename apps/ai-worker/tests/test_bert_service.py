@@ -20,3 +20,20 @@ def test_threshold_env_override(monkeypatch):
     importlib.reload(cmod)
     assert float(cmod.cfg.PHOBERT_BLOCK_THRESHOLD) == 0.9
     assert float(cmod.cfg.PHOBERT_WARN_THRESHOLD) == 0.8
+
+
+def test_id2label_matches_label_map():
+    for name, idx in cfg.LABEL_MAP.items():
+        assert cfg.ID2LABEL[idx] == name
+
+
+def test_softmax_np_rows_sum_to_one():
+    import numpy as np
+    from app.services.bert_service import _softmax_np
+
+    logits = np.array([[1.0, 2.0, 3.0], [1000.0, 1000.0, 1000.0]], dtype=np.float32)
+    probs = _softmax_np(logits)
+    assert np.allclose(probs.sum(axis=1), 1.0)
+    # Hàng logits cực lớn không overflow nhờ trừ max
+    assert np.allclose(probs[1], [1 / 3, 1 / 3, 1 / 3])
+    assert probs[0].argmax() == 2
@@ -49,3 +49,30 @@ def test_readyz_ready_with_dir(tmp_path):
     assert r.status_code == 200
     data = r.json()
     assert data["phobert_dir"] is True
+
+
+def test_moderation_uses_batcher_when_enabled():
+    os.environ["GATEWAY_API_KEY"] = "dev-secret"
+    app = create_app()
+
+    from app.services.bert_service import predict as predict_mod
+
+    calls: list = []
+
+    # Batcher "inline": submit trả thẳng kết quả predict, đủ để phủ nhánh gather
+    # trong handler (vòng đời worker nền đã được test riêng ở test_batcher.py).
+    class InlineBatcher:
+        async def submit(self, text):
+            calls.append(text)
+            return predict_mod([text], None)[0]
+
+    app.state.mod_batcher = InlineBatcher()
+    resp = TestClient(app).post(
+        "/moderation",
+        json={"inputs": ["xin chao", "đồ ngu quá"]},
+        headers={"x-api-key": "dev-secret"},
+    )
+    assert resp.status_code == 200
+    labels = [r["label"] for r in resp.json()["results"]]
+    assert "safe" in labels and "block" in labels
+    assert calls == ["xin chao", "đồ ngu quá"]
@@ -0,0 +1,24 @@
+from app.utils import chunk_bytes, BoundedLRUDict
+
+
+def test_chunk_bytes():
+    assert list(chunk_bytes(b"abcdef", 4)) == [b"abcd", b"ef"]
+
+
+def test_bounded_lru_dict_evicts_oldest():
+    d = BoundedLRUDict(max_size=2)
+    d["a"] = 1
+    d["b"] = 2
+    d["c"] = 3
+    assert "a" not in d
+    assert d.get("b") == 2 and d.get("c") == 3
+
+
+def test_bounded_lru_dict_get_refreshes_recency():
+    d = BoundedLRUDict(max_size=2)
+    d["a"] = 1
+    d["b"] = 2
+    assert d.get("a") == 1  # "a" trở thành mới nhất
+    d["c"] = 3
+    assert "b" not in d and "a" in d
+    assert d.get("missing") is None
@@ -17,7 +17,9 @@ Usage:
 """
 from __future__ import annotations
 
+import hashlib
 import os
+import re
 import sys
 from pathlib import Path
 from typing import Any
@@ -32,23 +34,161 @@ if str(AI_WORKER_DIR) not in sys.path:
 from app.services.bert_service import predict  # type: ignore
 
 
-def load_optional_onnx() -> dict[str, Any] | None:
+def _make_session(path: Path):
+    """InferenceSession với SessionOptions tường minh thay vì default.
+
+    ORT_ENABLE_ALL bật full graph optimization; intra=physical/2, inter=1 tránh
+    oversubscription trên máy nhiều core; spinning giữ worker nóng giữa các run.
+    """
+    import onnxruntime as ort  # type: ignore
+
+    so = ort.SessionOptions()
+    so.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+    so.intra_op_num_threads = max(1, (os.cpu_count() or 2) // 2)
+    so.inter_op_num_threads = 1
+    so.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
+    so.add_session_config_entry("session.intra_op.allow_spinning", "1")
+    return ort.InferenceSession(str(path), sess_options=so, providers=["CPUExecutionProvider"])
+
+
+# Keyword kỳ vọng của eval (lowercase sẵn); quét bằng Aho–Corasick một lượt
+# O(len(text)) thay vì mỗi keyword một lần substring-search Python.
+BLOCK_WORDS = ("đồ ngu", "chửi", "fuck", "dm", "cc", "khốn", "mất dạy")
+WARN_WORDS = ("cảnh báo", "warning")
+
+try:
+    # Tier 1: Hyperscan – multi-pattern DFA vector hóa bằng SIMD, một lượt
+    # scan cho cả danh sách; đáng giá khi keyword list vượt ~50 mục.
+    import hyperscan  # type: ignore
+
+    def _build_db(words: tuple[str, ...]):
+        db = hyperscan.Database()
+        db.compile(
+            expressions=[re.escape(w).encode("utf-8") for w in words],
+            ids=list(range(len(words))),
+            flags=[hyperscan.HS_FLAG_CASELESS | hyperscan.HS_FLAG_SINGLEMATCH] * len(words),
+        )
+        return db
+
+    _DB_BLOCK = _build_db(BLOCK_WORDS)
+    _DB_WARN = _build_db(WARN_WORDS)
+
+    def _scan_hit(db, data: bytes) -> bool:
+        hit = [False]
+        db.scan(data, match_event_handler=lambda *_a: hit.__setitem__(0, True))
+        return hit[0]
+
+    def _expected_label(sl: str) -> str:
+        b = sl.encode("utf-8")
+        if _scan_hit(_DB_BLOCK, b):
+            return "block"
+        if _scan_hit(_DB_WARN, b):
+            return "warn"
+        return "safe"
+except ImportError:
+    try:
+        # Tier 2: Aho–Corasick – vẫn một lượt O(len(text)) cho mọi keyword
+        import ahocorasick  # type: ignore
+
+        def _build_automaton(words: tuple[str, ...]):
+            a = ahocorasick.Automaton()
+            for w in words:
+                a.add_word(w, w)
+            a.make_automaton()
+            return a
+
+        _A_BLOCK = _build_automaton(BLOCK_WORDS)
+        _A_WARN = _build_automaton(WARN_WORDS)
+
+        def _expected_label(sl: str) -> str:
+            if next(_A_BLOCK.iter(sl), None) is not None:
+                return "block"
+            if next(_A_WARN.iter(sl), None) is not None:
+                return "warn"
+            return "safe"
+    except ImportError:
+
+        def _expected_label(sl: str) -> str:
+            if any(k in sl for k in BLOCK_WORDS):
+                return "block"
+            if any(k in sl for k in WARN_WORDS):
+                return "warn"
+            return "safe"
+
+
+# Cache session theo abs path: main() gọi lại (notebook/CI loop) không phải trả
+# tiền dựng lại graph + memory arena, và arena được amortize giữa các lần chạy.
+_SESSION_CACHE: dict[str, dict[str, Any]] = {}
+
+
+def _scenario_tokens(tokenizer) -> dict[str, Any]:
+    """Tokenized scenario tensors, cached on disk across processes.
+
+    Scenario text là tĩnh nên input_ids/attention_mask chỉ cần encode một lần;
+    key = sha1(tokenizer + nội dung scenario) để đổi corpus/tokenizer là tự
+    invalidate. Lần chạy sau (CI/dev loop) chỉ np.load thay vì tokenize lại.
+    """
+    import numpy as np  # type: ignore
+
+    key = hashlib.sha1(
+        (str(getattr(tokenizer, "name_or_path", "")) + repr(scenarios())).encode()
+    ).hexdigest()[:12]
+    cache_file = Path(".cache") / f"eval_tokens_{key}.npz"
+    if cache_file.exists():
+        with np.load(cache_file) as z:
+            return {"input_ids": z["input_ids"], "attention_mask": z["attention_mask"]}
+    texts = [s for _, inputs in scenarios() for s in inputs]
+    enc = tokenizer(texts, padding="longest", truncation=True, max_length=64,
+                    return_token_type_ids=False, return_tensors="np")
+    out = {
+        "input_ids": enc["input_ids"].astype(np.int64),
+        "attention_mask": enc["attention_mask"].astype(np.int64),
+    }
+    cache_file.parent.mkdir(parents=True, exist_ok=True)
+    np.savez_compressed(cache_file, **out)
+    return out
+
+
+def load_optional_onnx(n_inputs: int = 2) -> dict[str, Any] | None:
     """Try to load tokenizer + ONNX session if env configured; else None."""
     onnx_dir = os.getenv("PHOBERT_ONNX_DIR", "").strip()
     use_ort = os.getenv("USE_ONNXRUNTIME", "false").lower() in ("1", "true", "yes")
     if not (onnx_dir and use_ort):
         return None
+    # batch=1 → graph bs1 chuyên biệt (arena cố định); còn lại INT8 rồi model gốc
+    names = (["model_bs1.onnx"] if n_inputs <= 1 else []) + ["model_int8.onnx", "model.onnx"]
+    model_path = next((p for name in names if (p := Path(onnx_dir) / name).exists()), None)
+    if model_path is None:
+        print(f"[warn] ONNX model not found in {onnx_dir}; fallback to heuristic.")
+        return None
+    cache_key = str(model_path.resolve())
+    cached = _SESSION_CACHE.get(cache_key)
+    if cached is not None:
+        return cached
     try:
         from transformers import AutoTokenizer  # type: ignore
-        import onnxruntime as ort  # type: ignore
-
-        model_path = Path(onnx_dir) / "model.onnx"
-        if not model_path.exists():
-            print(f"[warn] ONNX model not found at {model_path}; fallback to heuristic.")
-            return None
-        tokenizer = AutoTokenizer.from_pretrained(onnx_dir, local_files_only=True)
-        session = ort.InferenceSession(str(model_path), providers=["CPUExecutionProvider"])  # noqa: E501
-        return {"tokenizer": tokenizer, "onnx_session": session}
+        tokenizer = AutoTokenizer.from_pretrained(onnx_dir, local_files_only=True, use_fast=True)
+        if not getattr(tokenizer, "is_fast", False):
+            print("[warn] Slow Python tokenizer in use; re-export with tokenizer.json for the Rust fast path")
+        session = _make_session(model_path)
+        # Warmup: một inference bỏ đi để MLAS chọn tile shape trước khi đo.
+        # Dùng token thật của scenario (cache .npz) thay vì zeros → đúng shape
+        # sẽ chạy; graph bs1 chỉ nhận batch=1 nên giữ warmup tối giản.
+        import numpy as np  # type: ignore
+
+        try:
+            toks = _scenario_tokens(tokenizer)
+            if model_path.name == "model_bs1.onnx":
+                toks = {k: v[:1] for k, v in toks.items()}
+            session.run(None, toks)
+        except Exception:
+            session.run(None, {
+                "input_ids": np.zeros((1, 8), dtype=np.int64),
+                "attention_mask": np.ones((1, 8), dtype=np.int64),
+            })
+        bundle = {"tokenizer": tokenizer, "onnx_session": session}
+        _SESSION_CACHE[cache_key] = bundle
+        return bundle
     except Exception as e:
         print(f"[warn] Failed to init ONNXRuntime path: {e}; fallback to heuristic.")
         return None
@@ -87,26 +227,26 @@ def scenarios() -> list[tuple[str, list[str]]]:
 
 
 def main() -> int:
-    phobert = load_optional_onnx()
+    # Gom toàn bộ scenario vào MỘT lời gọi predict: một lượt tokenize + forward
+    # cho cả corpus (predict tự bucket theo độ dài), thay vì 5 batch nhỏ lẻ.
+    groups = scenarios()
+    all_inputs = [s for _, inputs in groups for s in inputs]
+    phobert = load_optional_onnx(len(all_inputs))
     total, correct_like = 0, 0
 
     print("=== Moderation Evaluation ===")
     print(f"Use ONNX: {bool(phobert and phobert.get('onnx_session'))}")
-    for title, inputs in scenarios():
+    all_outputs = predict(all_inputs, phobert)
+    out_iter = iter(all_outputs)
+    for title, inputs in groups:
         print(f"\n--- {title} ---")
-        outputs = predict(inputs, phobert)
+        outputs = [next(out_iter) for _ in inputs]
         for s, o in zip(inputs, outputs):
             total += 1
             label = o.get("label")
             score = o.get("score")
             # Heuristic expected: bad → block, warn keywords → warn, else safe
-            sl = s.lower()
-            if any(k in sl for k in ["đồ ngu", "chửi", "fuck", "dm", "cc", "khốn", "mất dạy"]):
-                expected = "block"
-            elif any(k in sl for k in ["cảnh báo", "warning"]):
-                expected = "warn"
-            else:
-                expected = "safe"
+            expected = _expected_label(s.casefold())
             correct = (label == expected)
             correct_like += int(correct)
             print(f"[{ 'OK' if correct else '??' }] {s} => {label} ({score:.2f}) | expected={expected}")
@@ -0,0 +1,40 @@
+"""
+Quantize an exported PhoBERT ONNX model to INT8 (dynamic quantization).
+
+Usage (PowerShell):
+  python apps/ai-worker/tools/quantize_phobert.py ^
+    --src apps/ai-worker/app/models/bert-finetuned-onnx/model.onnx ^
+    --dst apps/ai-worker/app/models/bert-finetuned-onnx/model_int8.onnx
+
+Dynamic quantization stores Linear/MatMul weights as INT8 (~4x smaller) and
+runs them on VNNI int8 kernels on modern CPUs — typically 2-4x faster than
+FP32 PyTorch for this classifier. The worker's loader automatically prefers
+model_int8.onnx next to model.onnx when USE_ONNXRUNTIME is enabled.
+"""
+import argparse
+from pathlib import Path
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--src", required=True, help="Path to FP32 model.onnx")
+    ap.add_argument("--dst", default=None, help="Output path (default: model_int8.onnx next to src)")
+    args = ap.parse_args()
+
+    src = Path(args.src)
+    if not src.exists():
+        raise SystemExit(f"Not found: {src}. Run export_onnx_phobert.py first.")
+    dst = Path(args.dst) if args.dst else src.with_name("model_int8.onnx")
+
+    # Lazy import to avoid hard dependency if not used
+    try:
+        from onnxruntime.quantization import quantize_dynamic, QuantType
+    except Exception as e:  # pragma: no cover
+        raise SystemExit(f"onnxruntime quantization unavailable. pip install onnxruntime. Error: {e}")
+
+    quantize_dynamic(str(src), str(dst), weight_type=QuantType.QInt8)
+    print(f"Quantized {src} -> {dst} ({dst.stat().st_size / 1e6:.1f} MB)")
+
+
+if __name__ == "__main__":
+    main()
@@ -18,7 +18,9 @@ def main():
         "Đồ khốn nạn, câm mồm lại!",
         "Bạn có thể giúp tôi việc này không?",
     ]
-    enc = tok(sents, padding=True, truncation=True, max_length=256, return_tensors="pt")
+    # padding='longest' + max_length nhỏ: 3 câu ngắn không cần tensor 256 cột
+    # (attention là O(L^2)); PhoBERT kiểu RoBERTa không dùng token_type_ids.
+    enc = tok(sents, padding="longest", truncation=True, max_length=64, return_token_type_ids=False, return_tensors="pt")
     with torch.no_grad():
         logits = mdl(**enc).logits
         probs = F.softmax(logits, dim=-1).tolist()